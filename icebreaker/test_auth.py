@@ -16,51 +16,63 @@ The LED will blink fast when authenticated, slow when not.
 
 import sys
 import serial
-import time
-import threading
-import queue
+import traceback
+import selectors
 
 # Secret key (must match the one in top.v)
 SECRET_KEY = 0xA5C3
 
+# Response frame sent back to the iCEbreaker ("RESP:YYYY\n")
+RESP_FRAME = b"RESP:%04X\n"
+
 def compute_response(challenge):
     """Compute response from challenge using simple hash function"""
     return ((challenge ^ SECRET_KEY) + SECRET_KEY) & 0xFFFF
 
-def read_serial(ser, msg_queue):
-    """Background thread to read serial data"""
-    while True:
-        try:
-            line = ser.readline().decode('ascii', errors='ignore').strip()
-            if line:
-                msg_queue.put(line)
-        except Exception as e:
-            print(f"Read error: {e}")
-            break
+def read_lines(ser, pending):
+    """Read everything buffered on the port and split off complete raw lines"""
+    data = ser.read(ser.in_waiting or 1)
+    *lines, pending = (pending + data).split(b'\n')
+    return [line.strip() for line in lines], pending
 
 def handle_challenge(ser, challenge_line):
-    """Handle a challenge from the iCEbreaker"""
-    print(f"\n[AUTH] Received: {challenge_line}")
-
-    # Parse challenge
-    if not challenge_line.startswith("CHAL:"):
-        print(f"[ERROR] Expected 'CHAL:XXXX', got '{challenge_line}'")
+    """Handle a challenge (raw bytes, without newline) from the iCEbreaker"""
+    # Parse challenge straight from the fixed-width b"CHAL:XXXX" frame
+    try:
+        if len(challenge_line) != 9 or not challenge_line.startswith(b"CHAL:"):
+            raise ValueError
+        challenge = int(challenge_line[5:], 16)
+    except ValueError:
+        print(f"\n[ERROR] Expected 'CHAL:XXXX', got {challenge_line!r}")
         return False
 
-    challenge_str = challenge_line.split(':')[1]
-    challenge = int(challenge_str, 16)
-    print(f"[AUTH] Challenge: 0x{challenge:04X}")
-
     # Compute response
     response = compute_response(challenge)
-    print(f"[AUTH] Response: 0x{response:04X}")
 
-    # Send response
-    response_msg = f"RESP:{response:04X}\n"
-    ser.write(response_msg.encode('ascii'))
+    # Send response before logging so console output doesn't delay it
+    ser.write(RESP_FRAME % response)
+
+    print(f"\n[AUTH] Received: {challenge_line.decode('ascii')}")
+    print(f"[AUTH] Challenge: 0x{challenge:04X}")
     print(f"[AUTH] ✓ Authenticated!\n")
     return True
 
+def handle_command(ser, line):
+    """Handle a command typed by the user; returns False when the user quits"""
+    cmd = line.strip().upper()
+    if cmd == 'Y':
+        ser.write(cmd.encode('ascii'))
+        print(f"[CMD] Sent: Y → CONTROL_PIN = 0V (LOW/ground)")
+    elif cmd == 'N':
+        ser.write(cmd.encode('ascii'))
+        print(f"[CMD] Sent: N → CONTROL_PIN = 3.3V (HIGH)")
+    elif cmd == 'Q':
+        print("Exiting...")
+        return False
+    elif cmd:
+        print(f"[CMD] Invalid: {cmd}. Use Y (0V), N (3.3V), or Q to quit.")
+    return True
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python3 test_auth.py <serial_port>")
@@ -73,49 +85,56 @@ def main():
         # Open serial port
         print(f"Opening {port} at 115200 baud...")
         ser = serial.Serial(port, 115200, timeout=0.1)
-        time.sleep(0.1)
 
-        # Message queue for serial reads
-        msg_queue = queue.Queue()
+        # Drop any partial frame left over from before we opened the port
+        ser.reset_input_buffer()
 
-        # Start background reader thread
-        reader_thread = threading.Thread(target=read_serial, args=(ser, msg_queue), daemon=True)
-        reader_thread.start()
+        # Block until either the iCEbreaker or the user has something for us
+        sel = selectors.DefaultSelector()
+        sel.register(ser, selectors.EVENT_READ)
 
         print("\nWaiting for initial challenge from iCEbreaker...")
         print("(iCEbreaker will re-challenge every 5 seconds)\n")
 
         authenticated = False
-
-        # Main loop
-        while True:
-            # Check for messages from iCEbreaker
-            try:
-                msg = msg_queue.get_nowait()
-                if msg.startswith("CHAL:"):
-                    authenticated = handle_challenge(ser, msg)
-            except queue.Empty:
-                pass
-
-            # If authenticated, allow user to send commands
-            if authenticated:
-                # Non-blocking check for user input
-                import select
-                if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-                    cmd = sys.stdin.readline().strip().upper()
-                    if cmd == 'Y':
-                        ser.write(cmd.encode('ascii'))
-                        print(f"[CMD] Sent: Y → CONTROL_PIN = 0V (LOW/ground)")
-                    elif cmd == 'N':
-                        ser.write(cmd.encode('ascii'))
-                        print(f"[CMD] Sent: N → CONTROL_PIN = 3.3V (HIGH)")
-                    elif cmd == 'Q':
-                        print("Exiting...")
-                        break
-                    elif cmd:
-                        print(f"[CMD] Invalid: {cmd}. Use Y (0V), N (3.3V), or Q to quit.")
-
-            time.sleep(0.01)  # Small delay to prevent busy-waiting
+        pending = b''
+        stdin_open = True
+        running = True
+
+        while running:
+            for key, _ in sel.select():
+                if key.fileobj is ser:
+                    lines, pending = read_lines(ser, pending)
+                    for line in lines:
+                        if line.startswith(b"CHAL:"):
+                            authenticated = handle_challenge(ser, line)
+
+                    # Only listen for commands while authenticated
+                    watching_stdin = sys.stdin in sel.get_map()
+                    if authenticated and stdin_open and not watching_stdin:
+                        try:
+                            sel.register(sys.stdin, selectors.EVENT_READ)
+                        except PermissionError:
+                            # A file or /dev/null can't be polled; it is always readable
+                            stdin_open = False
+                            for line in sys.stdin:
+                                if not handle_command(ser, line):
+                                    running = False
+                                    break
+                    elif not authenticated and watching_stdin:
+                        sel.unregister(sys.stdin)
+                    continue
+
+                line = sys.stdin.readline()
+                if not line:
+                    # stdin closed (e.g. under nohup); keep answering challenges
+                    stdin_open = False
+                    sel.unregister(sys.stdin)
+                elif not handle_command(ser, line):
+                    running = False
+
+                if not running:
+                    break
 
     except KeyboardInterrupt:
         print("\n\nExiting...")
@@ -124,7 +143,6 @@ def main():
         sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
-        import traceback
         traceback.print_exc()
         sys.exit(1)
     finally:
@@ -16,22 +16,73 @@ Example:
     python3 flash_authenticated.py pico-examples/build/blink/blink.elf /dev/tty.usbmodem14101
 """
 
+import os
 import sys
 import serial
 import subprocess
 import time
+import traceback
 import glob
+from serial.tools import list_ports
 
 # Secret key (must match the one in top.v)
 SECRET_KEY = 0xA5C3
 
+# USB VID/PID of the picoprobe (Raspberry Pi debugprobe firmware)
+PICOPROBE_VID = 0x2E8A
+PICOPROBE_PID = 0x000C
+
+# Response frame sent back to the iCEbreaker ("RESP:YYYY\n")
+RESP_FRAME = b"RESP:%04X\n"
+
 def calculate_response(challenge):
     """Calculate the expected response for a given challenge."""
     return ((challenge ^ SECRET_KEY) + SECRET_KEY) & 0xFFFF
 
-def authenticate(ser, timeout=15):
+def set_low_latency(ser):
+    """Ask the OS to pass small serial packets through without buffering delay"""
+    # FTDI adapters on Linux hold data for up to 16 ms by default
+    tty = os.path.basename(ser.port)
+    try:
+        with open(f'/sys/bus/usb-serial/devices/{tty}/latency_timer', 'w') as f:
+            f.write('1')
+    except OSError:
+        pass  # Not an FTDI adapter (the picoprobe is CDC-ACM) or not Linux
+
+    try:
+        ser.set_low_latency_mode(True)
+    except (AttributeError, NotImplementedError, ValueError, OSError):
+        pass  # Not supported on this platform/driver
+
+def find_probe_port():
+    """Return the picoprobe's serial port, or None if none is attached."""
+    for port in list_ports.comports():
+        if port.vid == PICOPROBE_VID and port.pid == PICOPROBE_PID:
+            return port.device
+
+    # Fall back to the first USB modem device
+    ports = glob.glob('/dev/tty.usbmodem*')
+    return ports[0] if ports else None
+
+def write_frame(ser, data):
+    """Write a short frame straight to the tty, bypassing pyserial's write()."""
+    if sys.platform == 'win32':
+        ser.write(data)
+        return
+
+    fd = ser.fileno()
+    view = memoryview(data)
+    try:
+        while view:
+            view = view[os.write(fd, view):]
+    except BlockingIOError:
+        ser.write(view)  # Port buffer full; let pyserial wait for it to drain
+
+def authenticate(ser, timeout=15, command=None):
     """
     Wait for challenge and authenticate with the iCEbreaker.
+    If command ('Y' or 'N') is given, it is sent in the same write as the
+    response so the iCEbreaker acts on it as soon as it has authenticated.
     Returns True if authentication succeeds, False otherwise.
     """
     print("[AUTH] Waiting for challenge from iCEbreaker...")
@@ -39,37 +90,49 @@ def authenticate(ser, timeout=15):
 
     # Flush any stale data from the serial buffer
     ser.reset_input_buffer()
-    time.sleep(0.1)
 
-    start_time = time.time()
+    deadline = time.time() + timeout
+
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
 
-    while time.time() - start_time < timeout:
         try:
-            # Use readline() to block and wait for a complete line
-            line = ser.readline().decode('ascii', errors='ignore').strip()
-
-            if line:
-                print(f"[AUTH] Received: {line}")
-
-                if line.startswith('CHAL:'):
-                    challenge_hex = line[5:9]
-                    try:
-                        challenge = int(challenge_hex, 16)
-                        print(f"[AUTH] Received challenge: 0x{challenge:04X}")
-
-                        # Calculate and send response
-                        response = calculate_response(challenge)
-                        response_msg = f"RESP:{response:04X}\n"
-                        ser.write(response_msg.encode('ascii'))
-                        print(f"[AUTH] Sent response: {response_msg.strip()}")
-                        print("[AUTH] ✓ Authentication successful!")
-
-                        # Wait a bit for authentication to process
-                        time.sleep(0.2)
-                        return True
-                    except ValueError:
-                        print(f"[AUTH] Invalid challenge format: {line}")
-                        return False
+            # One blocking read for the rest of the timeout; returns on newline
+            ser.timeout = remaining
+            raw = ser.read_until(b'\n', size=64)
+            line = raw.strip()
+
+            if line.startswith(b'CHAL:'):
+                try:
+                    # Only accept a complete, fixed-width "CHAL:XXXX\n" frame; a read
+                    # cut short by the deadline must not be answered
+                    if not raw.endswith(b'\n') or len(line) != 9:
+                        raise ValueError
+                    challenge = int(line[5:], 16)
+
+                    # Calculate and send response before logging anything
+                    response = calculate_response(challenge)
+                    response_msg = RESP_FRAME % response
+                    if command:
+                        write_frame(ser, response_msg + command.encode('ascii'))
+                    else:
+                        write_frame(ser, response_msg)
+
+                    print(f"[AUTH] Received: {line.decode('ascii', errors='ignore')}")
+                    print(f"[AUTH] Received challenge: 0x{challenge:04X}")
+                    print(f"[AUTH] Sent response: {response_msg.decode('ascii').strip()}")
+                    print("[AUTH] ✓ Authentication successful!")
+
+                    # Make sure the response has actually left the host
+                    ser.flush()
+                    return True
+                except ValueError:
+                    print(f"[AUTH] Invalid challenge format: {line!r}")
+                    return False
+            elif line:
+                print(f"[AUTH] Received: {line.decode('ascii', errors='ignore')}")
         except Exception as e:
             print(f"[AUTH] Error reading serial: {e}")
             return False
@@ -77,14 +140,18 @@ def authenticate(ser, timeout=15):
     print("[AUTH] ✗ Timeout waiting for challenge")
     return False
 
-def send_control_command(ser, command):
-    """Send Y or N command to control the CONTROL_PIN."""
-    ser.write(command.encode('ascii'))
+def print_control_command(command):
+    """Report a Y or N command that was sent to the iCEbreaker."""
     if command == 'Y':
         print(f"[CTRL] Sent 'Y' → CONTROL_PIN = 0V (programming enabled)")
     elif command == 'N':
         print(f"[CTRL] Sent 'N' → CONTROL_PIN = 3.3V (programming disabled)")
-    time.sleep(0.1)  # Give time for command to process
+
+def send_control_command(ser, command):
+    """Send Y or N command to control the CONTROL_PIN."""
+    write_frame(ser, command.encode('ascii'))
+    ser.flush()  # Wait for the command to be transmitted
+    print_control_command(command)
 
 def flash_pico(elf_file):
     """Flash the target Pico using OpenOCD."""
@@ -136,11 +203,10 @@ def main():
         port = sys.argv[2]
     else:
         # Try to auto-detect picoprobe port
-        ports = glob.glob('/dev/tty.usbmodem*')
-        if not ports:
+        port = find_probe_port()
+        if not port:
             print("Error: No serial port found. Please specify port as second argument.")
             sys.exit(1)
-        port = ports[0]
         print(f"[INFO] Auto-detected serial port: {port}")
 
     try:
@@ -154,18 +220,19 @@ def main():
             stopbits=serial.STOPBITS_ONE,
             timeout=1
         )
+        set_low_latency(ser)
 
         print("[INFO] Connected to iCEbreaker\n")
 
         # Step 1: Authenticate with iCEbreaker
-        if not authenticate(ser):
+        # Step 2: 'Y' goes out with the response to enable programming (CONTROL_PIN = 0V)
+        if not authenticate(ser, command='Y'):
             print("\n[ERROR] Authentication failed. Exiting.")
             ser.close()
             sys.exit(1)
 
-        # Step 2: Send 'Y' to enable programming (CONTROL_PIN = 0V)
         print()
-        send_control_command(ser, 'Y')
+        print_control_command('Y')
 
         # Step 3: Flash the target Pico
         success = flash_pico(elf_file)
@@ -195,7 +262,6 @@ def main():
         sys.exit(1)
     except Exception as e:
         print(f"[ERROR] Unexpected error: {e}")
-        import traceback
         traceback.print_exc()
         if 'ser' in locals() and ser.is_open:
             ser.close()